@@ -2,13 +2,14 @@ import socket
 import sys
 import os
 import threading
+import time
 import tkinter as tk
 from tkinter import messagebox, simpledialog, font as tkfont
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from poker_game import Card, hand_description
-from network_utils import JSONSocket, ConnectionClosed
+from network_utils import JSONSocket, ConnectionClosed, longify
 
 
 class PokerGUI:
@@ -34,6 +35,8 @@ class PokerGUI:
         self.channel = None
         self.running = False
         self.last_actions = []
+        # Istante (monotonic) fino a cui la GUI sta ancora mostrando l'ultimo evento
+        self._ui_ready_at = 0.0
 
         self._build_connect_ui()
 
@@ -88,6 +91,7 @@ class PokerGUI:
         try:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.socket.connect((host, port))
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             self.channel = JSONSocket(self.socket)
         except Exception as e:
             self.status_label.config(text="Connessione fallita")
@@ -188,12 +192,20 @@ class PokerGUI:
                     self.cleanup_connection()
                     self.root.after(0, lambda: messagebox.showerror("Errore", "Connessione persa"))
                     break
-                self.root.after(0, lambda m=msg: self.handle_message(m))
+                self._schedule_message(longify(msg))
             except Exception:
                 if self.running:
                     self.cleanup_connection()
                 break
 
+    def _schedule_message(self, msg):
+        # Il server non rallenta più la partita: è il client a distanziare
+        # gli eventi che chiedono 'animate_ms', mantenendone l'ordine.
+        now = time.monotonic()
+        start = max(now, self._ui_ready_at)
+        self._ui_ready_at = start + msg.get('animate_ms', 0) / 1000
+        self.root.after(int((start - now) * 1000), lambda m=msg: self.handle_message(m))
+
     def handle_message(self, message):
         t = message.get('type')
 
@@ -208,6 +220,17 @@ class PokerGUI:
             self._log(text)
             return
 
+        if t == 'action_and_state':
+            self.handle_message(message.get('action') or {})
+            if message.get('state'):
+                self.handle_message(message['state'])
+            return
+
+        if t == 'phase_change':
+            if message.get('state'):
+                self.handle_message(message['state'])
+            return
+
         if t == 'deal':
             self.my_cards = [Card.from_dict(c) for c in message.get('cards', [])]
             self.update_game_display()
@@ -219,6 +242,13 @@ class PokerGUI:
             self.update_game_display()
             return
 
+        if t == 'state_patch':
+            if self.game_state is None:
+                return
+            self._apply_state_patch(message.get('changes', {}))
+            self.update_game_display()
+            return
+
         if t == 'your_turn':
             self.show_action_buttons()
             return
@@ -295,6 +325,15 @@ class PokerGUI:
                     pass
             return
 
+    def _apply_state_patch(self, changes):
+        for key, value in changes.items():
+            if key == 'players':
+                players = self.game_state.setdefault('players', {})
+                for pid, fields in value.items():
+                    players.setdefault(pid, {}).update(fields)
+            else:
+                self.game_state[key] = value
+
     def _log(self, text_line):
         self.last_actions.append(text_line)
         self.last_actions = self.last_actions[-6:]
@@ -416,7 +455,7 @@ class PokerGUI:
             self.suggestion_label.config(text="")
 
     def send_action(self, action, amount=None):
-        msg = {'action': action}
+        msg = {'type': 'action', 'action': action}
         if amount is not None:
             msg['amount'] = amount
         self.send_message(msg)
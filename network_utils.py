@@ -1,19 +1,112 @@
 from __future__ import annotations
 
 import json
+import os
 import socket
 import threading
-from typing import Any, Optional
+from typing import Any, Optional, Sequence
+
+
+# I messaggi sono alberi di dict/liste senza riferimenti circolari: il
+# controllo dei cicli dell'encoder è solo lavoro in più
+_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), check_circular=False)
+_DECODER = json.JSONDecoder()
+_RECV_SIZE = 4096
+# Massimo di byte ricevuti e non ancora letti (messaggi completi compresi):
+# oltre, il peer è considerato non valido
+MAX_FRAME = 64 * 1024
+# sendmsg non esiste su Windows: lì i buffer vengono concatenati
+_HAS_SENDMSG = hasattr(socket.socket, "sendmsg")
+
+
+def _iov_max() -> int:
+    try:
+        value = os.sysconf("SC_IOV_MAX")
+    except (AttributeError, ValueError, OSError):
+        return 1024
+    return value if value > 0 else 1024
+
+
+# Numero massimo di buffer per singola sendmsg: oltre, il kernel risponde EMSGSIZE
+_IOV_MAX = _iov_max()
+
+
+# Chiavi brevi usate sul filo per lo stato del tavolo (game_state e
+# state_patch) e per i messaggi che lo trasportano a ogni azione o cambio
+# di fase (action_and_state, player_action, phase_change)
+WIRE_KEYS = {
+    "type": "t",
+    "phase": "ph",
+    "pot": "p",
+    "community_cards": "cc",
+    "current_bet": "cb",
+    "players": "pl",
+    "your_id": "yi",
+    "active_player": "ap",
+    "dealer_button": "db",
+    "changes": "ch",
+    "name": "n",
+    "chips": "c",
+    "bet": "b",
+    "folded": "f",
+    "all_in": "a",
+    "stats": "s",
+    "action": "x",
+    "state": "st",
+    "animate_ms": "am",
+    "player_id": "pi",
+    "player_name": "pn",
+    "amount": "q",
+    "message": "m",
+    "new_cards": "nc",
+}
+_LONG_KEYS = {short: long for long, short in WIRE_KEYS.items()}
+
+
+def longify(message: Any) -> Any:
+    """Riporta ai nomi estesi le chiavi brevi di WIRE_KEYS in un messaggio ricevuto."""
+    if type(message) is dict:
+        return _longify_dict(message)
+    if type(message) is list:
+        return [longify(value) for value in message]
+    return message
+
+
+def _longify_dict(message: dict) -> dict:
+    # Gira su ogni messaggio ricevuto dal client: i valori scalari, la
+    # maggior parte, vengono copiati senza chiamate ricorsive
+    get_long = _LONG_KEYS.get
+    result = {}
+    for key, value in message.items():
+        kind = type(value)
+        if kind is dict:
+            value = _longify_dict(value)
+        elif kind is list:
+            value = [longify(item) for item in value]
+        result[get_long(key, key)] = value
+    return result
+
+
+def encode_message(message: Any, encoding: str = "utf-8") -> bytes:
+    return _ENCODER.encode(message).encode(encoding) + b"\n"
 
 
 class ConnectionClosed(Exception):
     pass
+
+
+class MessageTooLarge(ConnectionClosed):
+    pass
+
 class JSONSocket:
 
     def __init__(self, sock: socket.socket, encoding: str = "utf-8") -> None:
         self._socket = sock
         self._encoding = encoding
         self._buffer = bytearray()
+        # Buffer di ricezione riutilizzato da recv_into
+        self._recv_buf = bytearray(_RECV_SIZE)
+        self._recv_view = memoryview(self._recv_buf)
         self._send_lock = threading.Lock()
 
     def fileno(self) -> int:
@@ -23,34 +116,91 @@ class JSONSocket:
         self._socket.settimeout(value)
 
     def send(self, message: Any) -> None:
-        payload = json.dumps(message, ensure_ascii=False).encode(self._encoding) + b"\n"
+        self.send_raw(encode_message(message, self._encoding))
+
+    def send_raw(self, payload: bytes) -> None:
         with self._send_lock:
             self._socket.sendall(payload)
 
+    def send_parts(self, parts: Sequence[bytes]) -> None:
+        """Invia più buffer già serializzati con una scrittura vettoriale."""
+        if len(parts) == 1 or not _HAS_SENDMSG:
+            self.send_raw(b"".join(parts))
+            return
+
+        with self._send_lock:
+            if len(parts) <= _IOV_MAX:
+                self._sendmsg_all(parts)
+                return
+            # Una coda arretrata può superare il limite di buffer per chiamata
+            for start in range(0, len(parts), _IOV_MAX):
+                self._sendmsg_all(parts[start:start + _IOV_MAX])
+
+    def _sendmsg_all(self, parts: Sequence[bytes]) -> None:
+        sent = self._socket.sendmsg(parts)
+        total = sum(map(len, parts))
+        if sent == total:
+            return
+        # Invio parziale: si riprende da dove la scrittura si è fermata
+        views = [memoryview(part) for part in parts]
+        while True:
+            while views and sent >= len(views[0]):
+                sent -= len(views[0])
+                views.pop(0)
+            if not views:
+                return
+            if sent:
+                views[0] = views[0][sent:]
+            sent = self._socket.sendmsg(views)
+
     def receive(self, timeout: Optional[float] = None) -> Any:
+        if timeout is None:
+            # Percorso senza timeout: nessun gettimeout/settimeout per messaggio
+            try:
+                return self._next_message()
+            except socket.timeout as exc:
+                raise TimeoutError("Timeout durante la ricezione del messaggio") from exc
+
         previous_timeout = self._socket.gettimeout()
         try:
-            if timeout is not None:
-                self._socket.settimeout(timeout)
-
-            while True:
-                newline_index = self._buffer.find(b"\n")
-                if newline_index != -1:
-                    raw = self._buffer[:newline_index]
-                    del self._buffer[:newline_index + 1]
-                    if not raw:
-                        continue
-                    return json.loads(raw.decode(self._encoding))
-
-                chunk = self._socket.recv(4096)
-                if not chunk:
-                    raise ConnectionClosed("Il socket remoto è stato chiuso")
-                self._buffer.extend(chunk)
+            self._socket.settimeout(timeout)
+            return self._next_message()
         except socket.timeout as exc:
             raise TimeoutError("Timeout durante la ricezione del messaggio") from exc
         finally:
-            if timeout is not None:
-                self._socket.settimeout(previous_timeout)
+            self._socket.settimeout(previous_timeout)
+
+    def _next_message(self) -> Any:
+        while True:
+            newline_index = self._buffer.find(b"\n")
+            if newline_index != -1:
+                raw = self._buffer[:newline_index]
+                del self._buffer[:newline_index + 1]
+                if not raw:
+                    continue
+                return _DECODER.decode(raw.decode(self._encoding))
+
+            self._recv_chunk()
+
+    def has_message(self) -> bool:
+        # Le righe vuote sono scartate come in receive(): se il buffer
+        # contiene solo quelle, receive() finirebbe per leggere dal socket
+        if self._buffer.startswith(b"\n"):
+            del self._buffer[:len(self._buffer) - len(self._buffer.lstrip(b"\n"))]
+        return b"\n" in self._buffer
+
+    def read_available(self) -> None:
+        self._recv_chunk()
+
+    def _recv_chunk(self) -> None:
+        received = self._socket.recv_into(self._recv_buf)
+        if not received:
+            raise ConnectionClosed("Il socket remoto è stato chiuso")
+        self._buffer += self._recv_view[:received]
+        if len(self._buffer) > MAX_FRAME:
+            # Vale anche per i messaggi completi: un peer che ne invia senza
+            # sosta mentre nessuno li legge non fa crescere il buffer all'infinito
+            raise MessageTooLarge(f"Dati in attesa oltre {MAX_FRAME} byte")
 
     def close(self) -> None:
         try:
@@ -64,4 +214,5 @@ class JSONSocket:
     def socket(self) -> socket.socket:
         return self._socket
 
-__all__ = ["JSONSocket", "ConnectionClosed"]
+__all__ = ["JSONSocket", "ConnectionClosed", "MessageTooLarge", "MAX_FRAME",
+           "encode_message", "WIRE_KEYS", "longify"]
@@ -1,7 +1,8 @@
 import random
 import os
-from collections import Counter
 from enum import IntEnum
+from functools import lru_cache
+from operator import itemgetter
 
 
 class HandRank(IntEnum):
@@ -19,6 +20,9 @@ class HandRank(IntEnum):
 
 class Card:
 
+    # Al massimo 52 istanze vive, ma lette su ogni messaggio e valutazione
+    __slots__ = ('value', 'suit', 'rank', 'bit', '_dict')
+
     SUITS = ['♠', '♥', '♦', '♣']
     SUIT_NAMES = {'♠': 'Picche', '♥': 'Cuori', '♦': 'Quadri', '♣': 'Fiori'}
     VALUES = ['2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A']
@@ -33,6 +37,11 @@ class Card:
         self.value = value
         self.suit = suit
         self.rank = self.VALUE_MAP[value]
+        indice = self.rank - 2
+        # Bit univoco della carta nella maschera a 52 bit di una mano
+        self.bit = 1 << (self.SUITS.index(suit) * 13 + indice)
+        # Forma serializzata, calcolata una volta: le carte sono immutabili
+        self._dict = {'value': value, 'suit': suit}
 
     def __str__(self):
         return f"{self.value}{self.suit}"
@@ -41,36 +50,48 @@ class Card:
         return self.__str__()
 
     def to_dict(self):
-        return {'value': self.value, 'suit': self.suit}
+        """Dizionario condiviso tra tutte le chiamate: non va modificato."""
+        return self._dict
 
     @classmethod
     def from_dict(cls, data):
+        # Le carte sono immutabili: si restituisce l'istanza del mazzo
+        card = _CARDS_BY_KEY.get((data['value'], data['suit']))
+        if card is not None and type(card) is cls:
+            return card
         return cls(data['value'], data['suit'])
 
 
 class Deck:
 
+    # Le carte non cambiano mai: tutti i mazzi riusano le stesse 52 istanze
+    _FULL_DECK = [Card(value, suit) for suit in Card.SUITS for value in Card.VALUES]
+
     def __init__(self):
         self.cards = []
         self.reset()
 
     def reset(self):
-        self.cards = [Card(value, suit) for suit in Card.SUITS for value in Card.VALUES]
+        self.cards = self._FULL_DECK[:]
         self.shuffle()
 
     def shuffle(self):
+        """
+        Permutazione uniforme ottenuta ordinando le carte per chiavi casuali
+        a 64 bit, lette dal generatore di sistema con una sola richiesta
+        invece di una per carta.
+        """
         rng = random.SystemRandom()
-        for _ in range(3):
-            rng.shuffle(self.cards)
-        cut = rng.randint(0, len(self.cards)-1)
-        self.cards = self.cards[cut:] + self.cards[:cut]
+        n = len(self.cards)
+        keys = memoryview(rng.getrandbits(64 * n).to_bytes(8 * n, 'little')).cast('Q')
+        self.cards = [card for _, card in sorted(zip(keys, self.cards), key=itemgetter(0))]
 
-    def deal(self, num_cards=1):
-        
+    def deal(self, num_cards=1, out=None):
+        """Pesca num_cards carte; se out è indicato le accoda a quella lista."""
         if num_cards > len(self.cards):
             raise ValueError("Non ci sono abbastanza carte nel mazzo")
 
-        dealt_cards = []
+        dealt_cards = [] if out is None else out
         for _ in range(num_cards):
             dealt_cards.append(self.cards.pop())
         return dealt_cards
@@ -79,140 +100,163 @@ class Deck:
         return len(self.cards)
 
 
-def evaluate_hand(cards):
-    if len(cards) < 5:
-        raise ValueError("Servono almeno 5 carte per valutare una mano")
-
-    if len(cards) > 5:
-        from itertools import combinations
-        best_hand = None
-        best_rank = (HandRank.HIGH_CARD, [])
-
-        for combo in combinations(cards, 5):
-            hand_rank = _evaluate_five_cards(list(combo))
-            if hand_rank > best_rank:
-                best_rank = hand_rank
-                best_hand = combo
-
-        return best_rank
-    else:
-        return _evaluate_five_cards(cards)
-
-
-def _evaluate_five_cards(cards):
-    if len(cards) != 5:
-        raise ValueError("Questa funzione richiede esattamente 5 carte")
-
-    sorted_cards = sorted(cards, key=lambda c: c.rank, reverse=True)
-    ranks = [c.rank for c in sorted_cards]
-    suits = [c.suit for c in sorted_cards]
-
-    rank_counts = Counter(ranks)
-    count_values = sorted(rank_counts.values(), reverse=True)
-    unique_ranks = sorted(rank_counts.keys(), reverse=True)
-
-    is_flush = len(set(suits)) == 1
-
-    is_straight = False
-    straight_high = 0
+# (valore, seme) -> istanza condivisa, per Card.from_dict
+_CARDS_BY_KEY = {(card.value, card.suit): card for card in Deck._FULL_DECK}
 
-    if len(unique_ranks) == 5 and (max(ranks) - min(ranks) == 4):
-        is_straight = True
-        straight_high = max(ranks)
 
-    if sorted(ranks) == [2, 3, 4, 5, 14]:
-        is_straight = True
-        straight_high = 5 
-        
-    if is_straight and is_flush and min(ranks) == 10:
-        return (HandRank.ROYAL_FLUSH, [14])
-
-    if is_straight and is_flush:
-        return (HandRank.STRAIGHT_FLUSH, [straight_high])
-
-    if count_values == [4, 1]:
-        four_kind = [r for r, c in rank_counts.items() if c == 4][0]
-        kicker = [r for r, c in rank_counts.items() if c == 1][0]
-        return (HandRank.FOUR_OF_A_KIND, [four_kind, kicker])
-
-    if count_values == [3, 2]:
-        three_kind = [r for r, c in rank_counts.items() if c == 3][0]
-        pair = [r for r, c in rank_counts.items() if c == 2][0]
-        return (HandRank.FULL_HOUSE, [three_kind, pair])
-
-    if is_flush:
-        return (HandRank.FLUSH, sorted(ranks, reverse=True))
-
-    if is_straight:
-        return (HandRank.STRAIGHT, [straight_high])
-
-    if count_values == [3, 1, 1]:
-        three_kind = [r for r, c in rank_counts.items() if c == 3][0]
-        kickers = sorted([r for r, c in rank_counts.items() if c == 1], reverse=True)
-        return (HandRank.THREE_OF_A_KIND, [three_kind] + kickers)
-
-    if count_values == [2, 2, 1]:
-        pairs = sorted([r for r, c in rank_counts.items() if c == 2], reverse=True)
-        kicker = [r for r, c in rank_counts.items() if c == 1][0]
-        return (HandRank.TWO_PAIR, pairs + [kicker])
-
-    if count_values == [2, 1, 1, 1]:
-        pair = [r for r, c in rank_counts.items() if c == 2][0]
-        kickers = sorted([r for r, c in rank_counts.items() if c == 1], reverse=True)
-        return (HandRank.PAIR, [pair] + kickers)
-
-    return (HandRank.HIGH_CARD, sorted(ranks, reverse=True))
+def evaluate_hand(cards):
+    """
+    Valuta una mano di 5-7 carte. Restituisce (HandRank, valori decisivi):
+    due valutazioni si confrontano direttamente con < e >, e sono uguali
+    solo per mani di pari forza.
+    """
+    if not 5 <= len(cards) <= 7:
+        raise ValueError("Servono da 5 a 7 carte per valutare una mano")
+
+    mask = 0
+    for c in cards:
+        mask |= c.bit
+    return _evaluate_mask(mask)
+
+
+def evaluate_hand_bits(mask):
+    """Come evaluate_hand, per una mano data come OR dei Card.bit (5-7 carte)."""
+    if not 5 <= bin(mask).count("1") <= 7:
+        raise ValueError("Servono da 5 a 7 carte per valutare una mano")
+    return _evaluate_mask(mask)
+
+
+def _build_tables():
+    """
+    Tabelle indicizzate dalla maschera a 13 bit dei valori di un seme (o
+    dell'unione dei semi): valori presenti in ordine decrescente e valore
+    più alto di un'eventuale scala (0 se non c'è), e 1 se i valori bastano
+    per un colore.
+    """
+    top_ranks = []
+    straight_high = []
+    is_flush = bytearray(1 << 13)
+    windows = [(0x1F << low, low + 6) for low in range(8, -1, -1)]
+    windows.append((0x100F, 5))  # A-2-3-4-5
+
+    for mask in range(1 << 13):
+        top_ranks.append(tuple(r + 2 for r in range(12, -1, -1) if mask >> r & 1))
+        straight_high.append(next((high for window, high in windows
+                                   if mask & window == window), 0))
+        is_flush[mask] = len(top_ranks[mask]) >= 5
+
+    return top_ranks, straight_high, bytes(is_flush)
+
+
+_TOP_RANKS, _STRAIGHT_HIGH, _IS_FLUSH = _build_tables()
+
+
+@lru_cache(maxsize=4096)
+def _evaluate_mask(mask):
+    """
+    Valuta direttamente la maschera a 52 bit (5-7 carte), senza provare le
+    combinazioni da 5: le maschere per seme danno colori e molteplicità.
+    """
+    s0 = mask & 0x1FFF
+    s1 = (mask >> 13) & 0x1FFF
+    s2 = (mask >> 26) & 0x1FFF
+    s3 = mask >> 39
+
+    # Con al più 7 carte, un colore esclude poker e full. Il test a
+    # tabella scarta subito la grande maggioranza delle mani, senza colore
+    if _IS_FLUSH[s0] or _IS_FLUSH[s1] or _IS_FLUSH[s2] or _IS_FLUSH[s3]:
+        for suit_mask in (s0, s1, s2, s3):
+            if _IS_FLUSH[suit_mask]:
+                high = _STRAIGHT_HIGH[suit_mask]
+                if high == 14:
+                    return (HandRank.ROYAL_FLUSH, (14,))
+                if high:
+                    return (HandRank.STRAIGHT_FLUSH, (high,))
+                return (HandRank.FLUSH, _TOP_RANKS[suit_mask][:5])
+
+    # Valori presenti almeno una, due, tre e quattro volte
+    any1 = s0 | s1 | s2 | s3
+    any2 = (s0 & s1) | (s0 & s2) | (s0 & s3) | (s1 & s2) | (s1 & s3) | (s2 & s3)
+    any3 = (s0 & s1 & (s2 | s3)) | (s2 & s3 & (s0 | s1))
+    any4 = s0 & s1 & s2 & s3
+
+    if any4:
+        quad = _TOP_RANKS[any4][0]
+        kicker = _TOP_RANKS[any1 & ~(1 << (quad - 2))][0]
+        return (HandRank.FOUR_OF_A_KIND, (quad, kicker))
+
+    if any3:
+        trips = _TOP_RANKS[any3][0]
+        others = _TOP_RANKS[any2 & ~(1 << (trips - 2))]
+        if others:
+            return (HandRank.FULL_HOUSE, (trips, others[0]))
+
+    high = _STRAIGHT_HIGH[any1]
+    if high:
+        return (HandRank.STRAIGHT, (high,))
+
+    if any3:
+        kickers = _TOP_RANKS[any1 & ~(1 << (trips - 2))][:2]
+        return (HandRank.THREE_OF_A_KIND, (trips,) + kickers)
+
+    pairs = _TOP_RANKS[any2]
+    if len(pairs) >= 2:
+        high_pair, low_pair = pairs[0], pairs[1]
+        kicker = _TOP_RANKS[any1 & ~(1 << (high_pair - 2)) & ~(1 << (low_pair - 2))][0]
+        return (HandRank.TWO_PAIR, (high_pair, low_pair, kicker))
+
+    if pairs:
+        kickers = _TOP_RANKS[any1 & ~(1 << (pairs[0] - 2))][:3]
+        return (HandRank.PAIR, (pairs[0],) + kickers)
+
+    return (HandRank.HIGH_CARD, _TOP_RANKS[any1][:5])
 
 
 def compare_hands(hand1_cards, hand2_cards):
-    rank1, values1 = evaluate_hand(hand1_cards)
-    rank2, values2 = evaluate_hand(hand2_cards)
+    eval1 = evaluate_hand(hand1_cards)
+    eval2 = evaluate_hand(hand2_cards)
+    return (eval1 > eval2) - (eval1 < eval2)
 
-    if rank1 > rank2:
-        return 1
-    elif rank1 < rank2:
-        return -1
 
-    for v1, v2 in zip(values1, values2):
-        if v1 > v2:
-            return 1
-        elif v1 < v2:
-            return -1
+def hand_description(cards):
+    return describe_evaluation(evaluate_hand(cards))
 
-    return 0
 
+_VALUE_NAMES = {14: 'Assi', 13: 'Re', 12: 'Regine', 11: 'Jack',
+                10: 'Dieci', 9: 'Nove', 8: 'Otto', 7: 'Sette',
+                6: 'Sei', 5: 'Cinque', 4: 'Quattro', 3: 'Tre', 2: 'Due'}
 
-def hand_description(cards):
-    rank, values = evaluate_hand(cards)
+_VALUE_NAMES_SINGLE = {14: 'Asso', 13: 'Re', 12: 'Regina', 11: 'Jack',
+                       10: 'Dieci', 9: 'Nove', 8: 'Otto', 7: 'Sette',
+                       6: 'Sei', 5: 'Cinque', 4: 'Quattro', 3: 'Tre', 2: 'Due'}
 
-    value_names = {14: 'Assi', 13: 'Re', 12: 'Regine', 11: 'Jack',
-                   10: 'Dieci', 9: 'Nove', 8: 'Otto', 7: 'Sette',
-                   6: 'Sei', 5: 'Cinque', 4: 'Quattro', 3: 'Tre', 2: 'Due'}
 
-    value_names_single = {14: 'Asso', 13: 'Re', 12: 'Regina', 11: 'Jack',
-                          10: 'Dieci', 9: 'Nove', 8: 'Otto', 7: 'Sette',
-                          6: 'Sei', 5: 'Cinque', 4: 'Quattro', 3: 'Tre', 2: 'Due'}
+# Il client descrive la propria mano a ogni aggiornamento dello stato: le
+# valutazioni ripetute sono la norma, come per _evaluate_mask
+@lru_cache(maxsize=1024)
+def describe_evaluation(evaluation):
+    rank, values = evaluation
 
     if rank == HandRank.ROYAL_FLUSH:
         return "Scala Reale!"
     elif rank == HandRank.STRAIGHT_FLUSH:
-        return f"Scala Colore (fino a {value_names_single[values[0]]})"
+        return f"Scala Colore (fino a {_VALUE_NAMES_SINGLE[values[0]]})"
     elif rank == HandRank.FOUR_OF_A_KIND:
-        return f"Poker di {value_names[values[0]]}"
+        return f"Poker di {_VALUE_NAMES[values[0]]}"
     elif rank == HandRank.FULL_HOUSE:
-        return f"Full di {value_names[values[0]]} e {value_names[values[1]]}"
+        return f"Full di {_VALUE_NAMES[values[0]]} e {_VALUE_NAMES[values[1]]}"
     elif rank == HandRank.FLUSH:
         return "Colore"
     elif rank == HandRank.STRAIGHT:
-        return f"Scala (fino a {value_names_single[values[0]]})"
+        return f"Scala (fino a {_VALUE_NAMES_SINGLE[values[0]]})"
     elif rank == HandRank.THREE_OF_A_KIND:
-        return f"Tris di {value_names[values[0]]}"
+        return f"Tris di {_VALUE_NAMES[values[0]]}"
     elif rank == HandRank.TWO_PAIR:
-        return f"Doppia Coppia ({value_names[values[0]]} e {value_names[values[1]]})"
+        return f"Doppia Coppia ({_VALUE_NAMES[values[0]]} e {_VALUE_NAMES[values[1]]})"
     elif rank == HandRank.PAIR:
-        return f"Coppia di {value_names[values[0]]}"
+        return f"Coppia di {_VALUE_NAMES[values[0]]}"
     else:
-        return f"Carta Alta ({value_names_single[values[0]]})"
+        return f"Carta Alta ({_VALUE_NAMES_SINGLE[values[0]]})"
 
 
 if __name__ == "__main__":
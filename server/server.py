@@ -2,12 +2,29 @@ import socket
 import sys        
 import os        
 import time      
+import selectors
+import io
+import logging
+import logging.handlers
+import threading
+import queue
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from poker_game import Deck, evaluate_hand, compare_hands, hand_description
+from poker_game import Deck, evaluate_hand_bits, describe_evaluation
 
-from network_utils import JSONSocket, ConnectionClosed
+from network_utils import JSONSocket, ConnectionClosed, encode_message
+
+
+logger = logging.getLogger("poker.server")
+
+# Forma serializzata del 'your_id' segnaposto negli stati completi
+_SEGNAPOSTO_ID = b'"yi":-1'
+# IPTOS_LOWDELAY di <netinet/ip.h>, non esposto dal modulo socket
+_IPTOS_LOWDELAY = 0x10
+# Messaggi senza campi variabili, serializzati una volta per tutte
+_PAYLOAD_YOUR_TURN = encode_message({'type': 'your_turn'})
+_PAYLOAD_ASK_CONTINUE = encode_message({'type': 'ask_continue'})
 
 
 class TimeoutAzioneGiocatore(Exception):
@@ -26,6 +43,51 @@ class ConnessioneGiocatorePersa(Exception):
         super().__init__(f"Giocatore {id_giocatore} disconnesso")
 
 
+class StatoGiocatore:
+    """
+    Stato di un giocatore al tavolo (chips, carte, puntata e statistiche).
+    """
+    __slots__ = ('nome', 'chips', 'carte', 'carte_dict', 'bits_carte',
+                 'puntata', 'foldato', 'all_in', 'statistiche', 'wire')
+
+    def __init__(self, nome, chips):
+        self.nome = nome
+        self.chips = chips
+        self.carte = []
+        self.carte_dict = []
+        self.bits_carte = 0     # OR dei Card.bit delle carte in mano
+        self.puntata = 0
+        self.foldato = False
+        self.all_in = False
+        self.statistiche = {'mani_giocate': 0, 'mani_vinte': 0}
+        # Forma inviata ai client (chiavi brevi di WIRE_KEYS), aggiornata sul
+        # posto: contiene sempre gli ultimi valori inviati
+        self.wire = {
+            'n': nome,
+            'c': chips,
+            'b': 0,
+            'f': False,
+            'a': False,
+            's': dict(self.statistiche)
+        }
+
+    def aggiorna_wire(self):
+        """Riporta in wire i valori correnti e restituisce i campi cambiati."""
+        wire = self.wire
+        cambiati = {}
+        if wire['c'] != self.chips:
+            wire['c'] = cambiati['c'] = self.chips
+        if wire['b'] != self.puntata:
+            wire['b'] = cambiati['b'] = self.puntata
+        if wire['f'] != self.foldato:
+            wire['f'] = cambiati['f'] = self.foldato
+        if wire['a'] != self.all_in:
+            wire['a'] = cambiati['a'] = self.all_in
+        if wire['s'] != self.statistiche:
+            wire['s'] = cambiati['s'] = dict(self.statistiche)
+        return cambiati
+
+
 class ServerPoker:
     """
     Server per il gioco del poker Texas Hold'em per 2 giocatori.
@@ -38,24 +100,114 @@ class ServerPoker:
 
     """
 
+    # Fasi successive al pre-flop: (nome, carte comuni rivelate, messaggio)
+    FASI_CARTE_COMUNI = (
+        ('flop', 3, 'Flop: 3 carte comuni rivelate!'),
+        ('turn', 1, 'Turn: quarta carta comune rivelata!'),
+        ('river', 1, 'River: ultima carta comune rivelata!'),
+    )
+
+    # Messaggi in attesa di invio oltre i quali un client è considerato bloccato
+    MAX_CODA_INVIO = 64
+
     def __init__(self, host='0.0.0.0', porta=5555):
         # Parametri di rete
         self.host = host
         self.porta = porta
         self.socket_server = None  # Socket principale del server
+        self.selettore = selectors.DefaultSelector()  # Un solo loop per server e client
         
         self.clients = []
+        self._destinatari = []  # Id dei client connessi, aggiornati a ogni (dis)connessione
         
+        self.giocatori = []  # StatoGiocatore, indicizzati per id giocatore
+
         self.stato_gioco = {
-            'giocatori': {},        
-            'mazzo': None,          
+            'mazzo': Deck(),        # Riutilizzato a ogni mano
             'carte_comuni': [],    
+            'carte_comuni_dict': [],  # Forma serializzata di carte_comuni
+            'carte_comuni_bits': 0,   # OR dei Card.bit delle carte comuni
+            'versione_carte': 0,      # Incrementata a ogni modifica delle carte comuni
             'piatto': 0,            
             'puntata_corrente': 0,  
             'dealer_button': 0,     
             'fase': 'attesa',       
             'giocatore_attivo': 0,  
         }
+
+        # Ultimi valori del tavolo inviati ai client (chiavi brevi), per
+        # spedire solo le differenze; 'ph' None finché non si è inviato nulla
+        self._wire_tavolo = {'ph': None, 'p': 0, 'cb': 0, 'ap': 0, 'db': 0}
+        self._versione_carte_inviata = -1
+        # pid -> wire del giocatore: i dict restano gli stessi per tutta la partita
+        self._wire_giocatori = {}
+        # pid -> statistiche del giocatore, per i 'hand_result' (stessi dict)
+        self._statistiche = {}
+        # Campo 'your_id' già serializzato per ciascun client, da inserire
+        # al posto del segnaposto negli stati completi
+        self._campi_id = []
+        # 'game_state' riutilizzato a ogni stato completo: viene serializzato
+        # subito, quindi basta riscriverne i campi. L'ordine delle chiavi è
+        # fisso e 'yi' resta sempre il segnaposto
+        self._stato_completo = {
+            't': 'game_state', 'ph': None, 'p': 0, 'cc': [], 'cb': 0,
+            'pl': self._wire_giocatori, 'yi': -1, 'ap': 0, 'db': 0
+        }
+
+        # Acceso da ogni modifica dello stato visibile ai client: se è spento
+        # non c'è niente da inviare e lo stato non viene nemmeno ricostruito
+        self._stato_modificato = True
+
+        # Messaggi trattenuti per client durante la partita, accodati ai
+        # thread di invio solo prima di un'attesa (None se gli invii sono
+        # immediati, come durante i join)
+        self._in_coda = None
+
+        # Gestori delle azioni di gioco, costruiti una volta sola
+        self._gestori_azioni = {
+            'fold': self._azione_fold,
+            'check': self._azione_check,
+            'call': self._azione_call,
+            'raise': self._azione_raise,
+        }
+
+        # Modelli riutilizzati per i messaggi più frequenti: vengono
+        # serializzati subito dall'invio, quindi basta aggiornarne i campi
+        self._tmpl_player_action = {
+            't': 'player_action',
+            'pi': 0,
+            'pn': '',
+            'x': '',
+            'm': ''
+        }
+        # Stesso schema per le carte distribuite e per i risultati delle mani
+        self._tmpl_deal = {
+            'type': 'deal',
+            'cards': [],
+            'dealer_button': 0,
+            'animate_ms': 1000
+        }
+        self._tmpl_hand_result = {
+            'type': 'hand_result',
+            'winner_id': -1,
+            'winner_name': '',
+            'pot': 0,
+            'reason': '',
+            'all_cards': {},
+            'stats': self._statistiche
+        }
+
+        # Log della mano corrente: scritto su stdout in blocco a fine mano
+        self._log_buf = io.StringIO()
+
+        # Impostato da assegna_piatto quando l'avversario resta senza chips
+        self._vincitore_partita = None
+
+        # Bit i acceso se il giocatore i ha foldato / è all-in, aggiornati a
+        # ogni fold/all-in per non riscandire i giocatori
+        self._tutti = 0
+        self._maschera_foldati = 0
+        self._maschera_all_in = 0
         
        
         self.piccolo_blind = 5      
@@ -81,66 +233,136 @@ class ServerPoker:
         self.socket_server.bind((self.host, self.porta))
         
         self.socket_server.listen(2)
+        self.socket_server.setblocking(False)
+        self.selettore.register(self.socket_server, selectors.EVENT_READ)
+
+        logger.info("Server in ascolto su %s:%s", self.host, self.porta)
+        logger.info("In attesa di 2 giocatori...")
 
-        print(f"Server in ascolto su {self.host}:{self.porta}")
-        print("In attesa di 2 giocatori...")
+        in_attesa_join = {}  # canale -> (socket, indirizzo, scadenza)
 
         while len(self.clients) < 2:
-            socket_client, indirizzo = self.socket_server.accept()
-            print(f"Connessione da {indirizzo}")
+            timeout = None
+            if in_attesa_join:
+                prossima = min(scadenza for _, _, scadenza in in_attesa_join.values())
+                timeout = max(0, prossima - time.monotonic())
+
+            for chiave, _ in self.selettore.select(timeout):
+                if chiave.fileobj is self.socket_server:
+                    socket_client, indirizzo = self.socket_server.accept()
+                    self._configura_socket(socket_client)
+                    logger.info("Connessione da %s", indirizzo)
+
+                    canale = JSONSocket(socket_client)
+                    in_attesa_join[canale] = (socket_client, indirizzo, time.monotonic() + 10)
+                    self.selettore.register(canale, selectors.EVENT_READ)
+                    continue
 
-            canale = JSONSocket(socket_client)
-            
-            try:
-                dati = canale.receive(timeout=10)
-            except TimeoutError:
-                print("Nessun messaggio di join ricevuto: connessione chiusa")
-                canale.close()
-                continue
-            except ConnectionClosed:
-                canale.close()
-                continue
+                canale = chiave.fileobj
+                if canale not in in_attesa_join:
+                    continue
+                socket_client, indirizzo, _ = in_attesa_join[canale]
+
+                try:
+                    canale.read_available()
+                    if not canale.has_message():
+                        continue
+                    dati = canale.receive()
+                except (ConnectionClosed, OSError, ValueError):
+                    del in_attesa_join[canale]
+                    self.selettore.unregister(canale)
+                    canale.close()
+                    continue
 
-            if dati and dati.get('type') == 'join':
-                nome_giocatore = dati.get('name', 'Sconosciuto')
-                id_giocatore = len(self.clients)
-                
-                self.clients.append({
-                    'socket': socket_client,
-                    'indirizzo': indirizzo,
-                    'nome': nome_giocatore,
-                    'canale': canale,
-                    'connesso': True
-                })
-
-                self.stato_gioco['giocatori'][id_giocatore] = {
-                    'nome': nome_giocatore,
-                    'chips': self.chips_iniziali,
-                    'carte': [],           
-                    'puntata': 0,          
-                    'foldato': False,      
-                    'all_in': False,       
-                    'statistiche': {       
-                        'mani_giocate': 0,
-                        'mani_vinte': 0
-                    }
-                }
-
-                self.invia_messaggio(id_giocatore, {
-                    'type': 'joined',
-                    'player_id': id_giocatore,
-                    'message': f"Benvenuto {nome_giocatore}! Sei il giocatore {id_giocatore + 1}"
-                })
-
-                print(f"Giocatore {id_giocatore + 1}: {nome_giocatore}")
-            else:
-                print("Richiesta di join non valida. Chiudo la connessione.")
-                canale.close()
+                del in_attesa_join[canale]
+                self.selettore.unregister(canale)
+                self.registra_giocatore(canale, socket_client, indirizzo, dati)
+
+                if len(self.clients) == 2:
+                    break
 
-        print("\nTutti i giocatori sono connessi. Inizio il gioco!")
+            adesso = time.monotonic()
+            for canale, (_, _, scadenza) in list(in_attesa_join.items()):
+                if scadenza <= adesso:
+                    logger.info("Nessun messaggio di join ricevuto: connessione chiusa")
+                    del in_attesa_join[canale]
+                    self.selettore.unregister(canale)
+                    canale.close()
+
+        for canale in in_attesa_join:
+            self.selettore.unregister(canale)
+            canale.close()
+        # La partita è per due: chi si connette ora riceve subito un rifiuto
+        # invece di restare appeso nella coda di listen fino alla chiusura
+        self.selettore.unregister(self.socket_server)
+        self.socket_server.close()
+        self.socket_server = None
+
+        logger.info("\nTutti i giocatori sono connessi. Inizio il gioco!")
         self.inizia_partita()
 
+    @staticmethod
+    def _configura_socket(socket_client):
+        """Imposta le opzioni di un socket client appena accettato."""
+        socket_client.setblocking(True)
+        # Messaggi piccoli e interattivi: niente attese dell'algoritmo di Nagle
+        socket_client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        socket_client.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 64 * 1024)
+        socket_client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 64 * 1024)
+        # Il kernel sonda i peer inattivi: un client sparito senza FIN
+        # viene rilevato e gestito come disconnessione
+        socket_client.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        # Prima sonda dopo 30 s di silenzio, poi 3 tentativi a 10 s: circa
+        # un minuto invece delle due ore predefinite (opzioni non ovunque)
+        for opzione, valore in (('TCP_KEEPIDLE', 30), ('TCP_KEEPINTVL', 10), ('TCP_KEEPCNT', 3)):
+            if hasattr(socket, opzione):
+                socket_client.setsockopt(socket.IPPROTO_TCP, getattr(socket, opzione), valore)
+        # Traffico interattivo: chiede ai router una consegna a bassa latenza
+        if hasattr(socket, 'IP_TOS'):
+            try:
+                socket_client.setsockopt(socket.IPPROTO_IP, socket.IP_TOS, _IPTOS_LOWDELAY)
+            except OSError:
+                pass  # Non supportato dalla piattaforma
+
+    def registra_giocatore(self, canale, socket_client, indirizzo, dati):
+        if dati and dati.get('type') == 'join':
+            nome_giocatore = dati.get('name', 'Sconosciuto')
+            id_giocatore = len(self.clients)
+
+            self.clients.append({
+                'socket': socket_client,
+                'indirizzo': indirizzo,
+                'nome': nome_giocatore,
+                'canale': canale,
+                'connesso': True,
+                'coda_invio': queue.Queue(maxsize=self.MAX_CODA_INVIO),
+                'errore_invio': False,
+                'epoca_stato': 0  # Stati completi accodati finora
+            })
+            self.selettore.register(canale, selectors.EVENT_READ, id_giocatore)
+            self._avvia_mittente(id_giocatore)
+            self._aggiorna_destinatari()
+
+            self.giocatori.append(StatoGiocatore(nome_giocatore, self.chips_iniziali))
+            self._wire_giocatori[id_giocatore] = self.giocatori[id_giocatore].wire
+            self._statistiche[id_giocatore] = self.giocatori[id_giocatore].statistiche
+            self._campi_id.append(b'"yi":%d' % id_giocatore)
+
+            self.invia_messaggio(id_giocatore, {
+                'type': 'joined',
+                'player_id': id_giocatore,
+                'message': f"Benvenuto {nome_giocatore}! Sei il giocatore {id_giocatore + 1}"
+            })
+
+            logger.info("Giocatore %d: %s", id_giocatore + 1, nome_giocatore)
+        else:
+            logger.info("Richiesta di join non valida. Chiudo la connessione.")
+            canale.close()
+
     def inizia_partita(self):
+        # Da qui i messaggi partono a blocchi: tutto ciò che il server invia
+        # tra due attese di risposta arriva a ogni client in una sola scrittura
+        self._in_coda = {}
         try:
             while True:
                 self.nuova_mano()
@@ -149,61 +371,66 @@ class ServerPoker:
                 if not self.chiedi_continua():
                     break
 
-                for id_giocatore, giocatore in self.stato_gioco['giocatori'].items():
-                    if giocatore['chips'] <= 0:
-                        id_vincitore = 1 - id_giocatore 
-                        vincitore = self.stato_gioco['giocatori'][id_vincitore]
-                        self.broadcast({
-                            'type': 'game_over',
-                            'winner': vincitore['nome'],
-                            'message': f"{vincitore['nome']} ha vinto la partita!"
-                        })
-                        return
+                if self._vincitore_partita is not None:
+                    vincitore = self.giocatori[self._vincitore_partita]
+                    self.broadcast({
+                        'type': 'game_over',
+                        'winner': vincitore.nome,
+                        'message': f"{vincitore.nome} ha vinto la partita!"
+                    })
+                    return
 
         except ConnessioneGiocatorePersa as errore:
             self.gestisci_disconnessione(errore.id_giocatore)
         except Exception as errore:
-            print(f"Errore durante il gioco: {errore}")
-            import traceback
-            traceback.print_exc()
+            self._svuota_log()
+            logger.exception("Errore durante il gioco: %s", errore)
         finally:
             self.chiudi()
 
     def nuova_mano(self):
-        print("\n" + "=" * 60)
-        print("NUOVA MANO")
-        print("=" * 60)
-
-        self.stato_gioco['mazzo'] = Deck() 
-        self.stato_gioco['carte_comuni'] = []
+        self._log("\n" + "=" * 60)
+        self._log("NUOVA MANO")
+        self._log("=" * 60)
+
+        self.stato_gioco['mazzo'].reset()
+        self.stato_gioco['carte_comuni'].clear()
+        self.stato_gioco['carte_comuni_dict'] = []
+        self.stato_gioco['carte_comuni_bits'] = 0
+        self.stato_gioco['versione_carte'] += 1
         self.stato_gioco['piatto'] = 0
         self.stato_gioco['puntata_corrente'] = 0
         self.stato_gioco['fase'] = 'pre_flop' 
+        self._stato_modificato = True
 
-        for giocatore in self.stato_gioco['giocatori'].values():
-            giocatore['carte'] = []
-            giocatore['puntata'] = 0
-            giocatore['foldato'] = False
-            giocatore['all_in'] = False
-            giocatore.setdefault('statistiche', {'mani_giocate': 0, 'mani_vinte': 0})
-            giocatore['statistiche']['mani_giocate'] += 1
+        for giocatore in self.giocatori:
+            giocatore.carte.clear()
+            giocatore.carte_dict = []
+            giocatore.bits_carte = 0
+            giocatore.puntata = 0
+            giocatore.foldato = False
+            giocatore.all_in = False
+            giocatore.statistiche['mani_giocate'] += 1
+
+        self._tutti = (1 << len(self.giocatori)) - 1
+        self._maschera_foldati = 0
+        self._maschera_all_in = 0
 
         self.stato_gioco['dealer_button'] = 1 - self.stato_gioco['dealer_button']
 
         for id_giocatore in range(2):
-            carte = self.stato_gioco['mazzo'].deal(2)  # Pesco 2 carte
-            self.stato_gioco['giocatori'][id_giocatore]['carte'] = carte
+            carte = self.stato_gioco['mazzo'].deal(2, out=self.giocatori[id_giocatore].carte)
+            self.giocatori[id_giocatore].carte_dict = [c.to_dict() for c in carte]
+            self.giocatori[id_giocatore].bits_carte = carte[0].bit | carte[1].bit
 
+        messaggio_carte = self._tmpl_deal
+        messaggio_carte['dealer_button'] = self.stato_gioco['dealer_button']
         for id_giocatore in range(len(self.clients)):
-            self.invia_messaggio(id_giocatore, {
-                'type': 'deal',
-                'cards': [c.to_dict() for c in self.stato_gioco['giocatori'][id_giocatore]['carte']],
-                'dealer_button': self.stato_gioco['dealer_button']
-            })
+            messaggio_carte['cards'] = self.giocatori[id_giocatore].carte_dict
+            self.invia_messaggio(id_giocatore, messaggio_carte)
 
         self.pubblica_blind()
 
-        time.sleep(1)
         self.broadcast_stato_gioco()
 
     def pubblica_blind(self):
@@ -214,309 +441,331 @@ class ServerPoker:
 
         importo_piccolo = min(
             self.piccolo_blind, 
-            self.stato_gioco['giocatori'][giocatore_piccolo]['chips']
+            self.giocatori[giocatore_piccolo].chips
         )
-        self.stato_gioco['giocatori'][giocatore_piccolo]['chips'] -= importo_piccolo
-        self.stato_gioco['giocatori'][giocatore_piccolo]['puntata'] = importo_piccolo
+        self.giocatori[giocatore_piccolo].chips -= importo_piccolo
+        self.giocatori[giocatore_piccolo].puntata = importo_piccolo
         self.stato_gioco['piatto'] += importo_piccolo
 
         importo_grande = min(
             self.grande_blind, 
-            self.stato_gioco['giocatori'][giocatore_grande]['chips']
+            self.giocatori[giocatore_grande].chips
         )
-        self.stato_gioco['giocatori'][giocatore_grande]['chips'] -= importo_grande
-        self.stato_gioco['giocatori'][giocatore_grande]['puntata'] = importo_grande
+        self.giocatori[giocatore_grande].chips -= importo_grande
+        self.giocatori[giocatore_grande].puntata = importo_grande
         self.stato_gioco['piatto'] += importo_grande
 
         self.stato_gioco['puntata_corrente'] = importo_grande
 
         self.stato_gioco['giocatore_attivo'] = dealer
 
-        print(f"{self.stato_gioco['giocatori'][giocatore_piccolo]['nome']} paga small blind: {importo_piccolo}")
-        print(f"{self.stato_gioco['giocatori'][giocatore_grande]['nome']} paga big blind: {importo_grande}")
+        self._log("%s paga small blind: %s", self.giocatori[giocatore_piccolo].nome, importo_piccolo)
+        self._log("%s paga big blind: %s", self.giocatori[giocatore_grande].nome, importo_grande)
 
     def gioca_mano(self):
         
         if not self.giro_puntate():
             return 
 
-        if self.stato_gioco['fase'] == 'pre_flop':
-            self.stato_gioco['carte_comuni'] = self.stato_gioco['mazzo'].deal(3)
-            self.stato_gioco['fase'] = 'flop'
-            print(f"\nFLOP: {self.stato_gioco['carte_comuni']}")
-  
-            self.broadcast({
-                'type': 'phase_change',
-                'phase': 'flop',
-                'message': 'Flop: 3 carte comuni rivelate!'
-            })
-            time.sleep(0.5)
-            self.broadcast_stato_gioco()
-            time.sleep(0.5)
-
-            if not self.giro_puntate():
-                return
-
-        if self.stato_gioco['fase'] == 'flop':
-            self.stato_gioco['carte_comuni'].extend(self.stato_gioco['mazzo'].deal(1))
-            self.stato_gioco['fase'] = 'turn'
-            print(f"\nTURN: {self.stato_gioco['carte_comuni'][-1]}")
-
-            self.broadcast({
-                'type': 'phase_change',
-                'phase': 'turn',
-                'message': 'Turn: quarta carta comune rivelata!'
-            })
-            time.sleep(0.5)
-            self.broadcast_stato_gioco()
-            time.sleep(0.5)
-
-            if not self.giro_puntate():
-                return
-
-        if self.stato_gioco['fase'] == 'turn':
-            self.stato_gioco['carte_comuni'].extend(self.stato_gioco['mazzo'].deal(1))
-            self.stato_gioco['fase'] = 'river'
-            print(f"\nRIVER: {self.stato_gioco['carte_comuni'][-1]}")
-
-            self.broadcast({
-                'type': 'phase_change',
-                'phase': 'river',
-                'message': 'River: ultima carta comune rivelata!'
-            })
-            time.sleep(0.5)
-            self.broadcast_stato_gioco()
-            time.sleep(0.5)
+        for fase, numero_carte, testo in self.FASI_CARTE_COMUNI:
+            carte_comuni = self.stato_gioco['carte_comuni']
+            inizio = len(carte_comuni)
+            self.stato_gioco['mazzo'].deal(numero_carte, out=carte_comuni)
+            nuove_carte = carte_comuni[inizio:]
+            self.stato_gioco['carte_comuni_dict'].extend(c.to_dict() for c in nuove_carte)
+            for carta in nuove_carte:
+                self.stato_gioco['carte_comuni_bits'] |= carta.bit
+            self.stato_gioco['versione_carte'] += 1
+            self.stato_gioco['fase'] = fase
+            self._stato_modificato = True
+            if logger.isEnabledFor(logging.DEBUG):
+                self._log("\n%s: %s", fase.upper(), ', '.join(str(c) for c in nuove_carte))
+
+            self._annuncia_fase(fase, nuove_carte, testo)
 
             if not self.giro_puntate():
                 return
 
         self.showdown()
 
-    def giro_puntate(self):
-        for giocatore in self.stato_gioco['giocatori'].values():
-            giocatore['puntata'] = 0 if self.stato_gioco['fase'] != 'pre_flop' else giocatore['puntata']
+    def _annuncia_fase(self, fase, nuove_carte, testo):
+        """
+        Annuncia il cambio di fase inviando in un solo messaggio le nuove
+        carte comuni e lo stato aggiornato del tavolo.
+        """
+        self._broadcast_stato(self._con_stato({
+            't': 'phase_change',
+            'ph': fase,
+            'm': testo,
+            'nc': [c.to_dict() for c in nuove_carte],
+            'am': 1000
+        }))
 
-        if self.stato_gioco['fase'] != 'pre_flop':
-            self.stato_gioco['puntata_corrente'] = 0
-            self.stato_gioco['giocatore_attivo'] = 1 - self.stato_gioco['dealer_button']
+    def giro_puntate(self):
+        # Riferimenti locali: il ciclo li legge a ogni azione
+        stato = self.stato_gioco
+        giocatori = self.giocatori
+        n_giocatori = len(giocatori)
+
+        if stato['fase'] != 'pre_flop':
+            for giocatore in giocatori:
+                giocatore.puntata = 0
+            stato['puntata_corrente'] = 0
+            stato['giocatore_attivo'] = 1 - stato['dealer_button']
+        self._stato_modificato = True
 
         contatore_azioni = 0
-        giocatori_agiti = set()
+        # Bit i acceso se il giocatore i ha già agito in questo giro
+        maschera_agiti = 0
+        tutti_agiti = (1 << n_giocatori) - 1
+        # Giocatori in pari con la puntata corrente (o foldati / all-in)
+        pareggiati = self._conta_pareggiati()
 
         while True:
-            attivi_che_possono_agire = [
-                pid for pid, g in self.stato_gioco['giocatori'].items()
-                if not g['foldato'] and not g['all_in']
-            ]
-            
-            if len(attivi_che_possono_agire) == 0:
+            # Giocatori che possono ancora agire: né foldati né all-in
+            attivi = self._tutti & ~(self._maschera_foldati | self._maschera_all_in)
+            if not attivi:
                 break
 
-            if len(attivi_che_possono_agire) == 1:
-                id_rimasto = attivi_che_possono_agire[0]
-                rimasto = self.stato_gioco['giocatori'][id_rimasto]
-                if rimasto['puntata'] >= self.stato_gioco['puntata_corrente']:
-                    break
+            id_giocatore = stato['giocatore_attivo']
+            giocatore = giocatori[id_giocatore]
+            puo_agire = attivi >> id_giocatore & 1
 
-            id_giocatore = self.stato_gioco['giocatore_attivo']
-            giocatore = self.stato_gioco['giocatori'][id_giocatore]
+            if not attivi & (attivi - 1):
+                # Ne resta uno solo: continua finché non ha pareggiato
+                id_rimasto = attivi.bit_length() - 1
+                rimasto = giocatori[id_rimasto]
+                if rimasto.puntata >= stato['puntata_corrente']:
+                    break
 
-            if giocatore['foldato'] or giocatore['all_in']:
-                self.stato_gioco['giocatore_attivo'] = 1 - id_giocatore
+            if not puo_agire:
+                stato['giocatore_attivo'] = 1 - id_giocatore
+                self._stato_modificato = True
                 continue
 
-            if len(giocatori_agiti) == 2 and all(
-                self.stato_gioco['giocatori'][p]['puntata'] == self.stato_gioco['puntata_corrente']
-                or self.stato_gioco['giocatori'][p]['foldato']
-                or self.stato_gioco['giocatori'][p]['all_in']
-                for p in range(2)
-            ):
+            if maschera_agiti == tutti_agiti and pareggiati == n_giocatori:
                 break
 
-            self.invia_messaggio(id_giocatore, {'type': 'your_turn'})
+            self._scarta_arretrati(id_giocatore)
+            self.invia_payload(id_giocatore, _PAYLOAD_YOUR_TURN)
 
             try:
-                dati_azione = self.ricevi_messaggio(id_giocatore, timeout=self.timeout_azione)
+                dati_azione = self._ricevi_azione(id_giocatore)
             except TimeoutAzioneGiocatore:
                 if self.gestisci_fold_forzato(id_giocatore, 'timeout'):
                     return False
+                pareggiati = self._conta_pareggiati()
                 continue
             except ConnessioneGiocatorePersa as errore:
                 self.gestisci_disconnessione(errore.id_giocatore)
                 return False
 
-            if not dati_azione:
-                continue
-
             azione = dati_azione.get('action')
             importo = dati_azione.get('amount', 0)
+            era_pareggiato = self._pareggiato(giocatore)
+
+            gestore = self._gestori_azioni.get(azione)
+            messaggio_azione = None
+            if gestore is not None:
+                messaggio_azione = gestore(id_giocatore, giocatore, importo)
+                if messaggio_azione is None:
+                    continue  # Azione rifiutata: il giocatore deve riprovare
+                self._stato_modificato = True
+
+            if azione == 'raise':
+                maschera_agiti = 1 << id_giocatore
+                pareggiati = self._conta_pareggiati()
+            else:
+                maschera_agiti |= 1 << id_giocatore
+                pareggiati += self._pareggiato(giocatore) - era_pareggiato
 
-            if azione == 'fold':
-                giocatore['foldato'] = True
-                print(f"{giocatore['nome']} ha foldato")
-
-                self.broadcast({
-                    'type': 'player_action',
-                    'player_id': id_giocatore,
-                    'player_name': giocatore['nome'],
-                    'action': 'fold',
-                    'message': f"{giocatore['nome']} ha foldato"
-                })
-                time.sleep(0.3)
+            if messaggio_azione is not None:
+                self._broadcast_azione_con_stato(messaggio_azione)
+            else:
                 self.broadcast_stato_gioco()
 
-                giocatori_rimasti = [g for g in self.stato_gioco['giocatori'].values() if not g['foldato']]
-                if len(giocatori_rimasti) == 1:
-                    id_vincitore = [i for i, g in self.stato_gioco['giocatori'].items() if not g['foldato']][0]
-                    self.assegna_piatto(id_vincitore, "fold")
-                    return False
-
-            elif azione == 'check':
-                if giocatore['puntata'] < self.stato_gioco['puntata_corrente']:
-                    self.invia_messaggio(id_giocatore, {
-                        'type': 'error',
-                        'message': 'Non puoi fare check, devi chiamare o rilanciare'
-                    })
-                    continue
-                    
-                print(f"{giocatore['nome']} ha fatto check")
-                self.broadcast({
-                    'type': 'player_action',
-                    'player_id': id_giocatore,
-                    'player_name': giocatore['nome'],
-                    'action': 'check',
-                    'message': f"{giocatore['nome']} ha fatto check"
-                })
-                time.sleep(0.3)
-
-            elif azione == 'call':
-                da_chiamare = self.stato_gioco['puntata_corrente'] - giocatore['puntata']
-                da_chiamare = min(da_chiamare, giocatore['chips'])  # Non più di quello che ho
-                
-                giocatore['chips'] -= da_chiamare
-                giocatore['puntata'] += da_chiamare
-                self.stato_gioco['piatto'] += da_chiamare
-                print(f"{giocatore['nome']} ha chiamato {da_chiamare}")
-
-                if giocatore['chips'] == 0:
-                    giocatore['all_in'] = True
-                    print(f"{giocatore['nome']} è all-in!")
-
-                self.broadcast({
-                    'type': 'player_action',
-                    'player_id': id_giocatore,
-                    'player_name': giocatore['nome'],
-                    'action': 'call',
-                    'amount': da_chiamare,
-                    'message': f"{giocatore['nome']} ha chiamato {da_chiamare}"
-                })
-                time.sleep(0.3)
-
-            elif azione == 'raise':
-                rilancio_minimo = self.stato_gioco['puntata_corrente'] * 2 - giocatore['puntata']
-                
-                if importo < rilancio_minimo and importo < giocatore['chips']:
-                    self.invia_messaggio(id_giocatore, {
-                        'type': 'error',
-                        'message': f'Il rilancio minimo è {rilancio_minimo}'
-                    })
-                    continue
-
-                importo = min(importo, giocatore['chips'])
-                giocatore['chips'] -= importo
-                self.stato_gioco['piatto'] += importo
-                giocatore['puntata'] += importo
-                self.stato_gioco['puntata_corrente'] = giocatore['puntata']
-                
-                giocatori_agiti = {id_giocatore}
-
-                e_all_in = giocatore['chips'] == 0
-                if e_all_in:
-                    giocatore['all_in'] = True
-                    print(f"{giocatore['nome']} è all-in con {importo}!")
-                else:
-                    print(f"{giocatore['nome']} ha rilanciato a {giocatore['puntata']}")
-
-                testo_azione = 'all-in' if e_all_in else 'raise'
-                messaggio = f"{giocatore['nome']} è ALL-IN con {importo}!" if e_all_in else f"{giocatore['nome']} ha rilanciato a {giocatore['puntata']}"
-
-                self.broadcast({
-                    'type': 'player_action',
-                    'player_id': id_giocatore,
-                    'player_name': giocatore['nome'],
-                    'action': testo_azione,
-                    'amount': importo,
-                    'message': messaggio
-                })
-                time.sleep(0.3)
-
-            giocatori_agiti.add(id_giocatore)
-            self.broadcast_stato_gioco()
+            id_vincitore = self._unico_non_foldato()
+            if id_vincitore is not None:
+                self.assegna_piatto(id_vincitore, "fold")
+                return False
 
             # Passo al prossimo giocatore
-            self.stato_gioco['giocatore_attivo'] = 1 - id_giocatore
+            stato['giocatore_attivo'] = 1 - id_giocatore
+            self._stato_modificato = True
             contatore_azioni += 1
 
         return True
 
+    def _messaggio_azione(self, id_giocatore, azione, messaggio, importo=None):
+        """Riempie il modello 'player_action' (l'importo solo se presente)."""
+        modello = self._tmpl_player_action
+        modello['pi'] = id_giocatore
+        modello['pn'] = self.giocatori[id_giocatore].nome
+        modello['x'] = azione
+        modello['m'] = messaggio
+        if importo is None:
+            modello.pop('q', None)
+        else:
+            modello['q'] = importo
+        return modello
+
+    # Ogni gestore applica l'azione e restituisce il messaggio 'player_action'
+    # da inviare, oppure None se l'azione non è valida (errore già notificato).
+
+    def _azione_fold(self, id_giocatore, giocatore, importo):
+        self._segna_fold(id_giocatore, giocatore)
+        self._log("%s ha foldato", giocatore.nome)
+
+        return self._messaggio_azione(id_giocatore, 'fold', f"{giocatore.nome} ha foldato")
+
+    def _azione_check(self, id_giocatore, giocatore, importo):
+        if giocatore.puntata < self.stato_gioco['puntata_corrente']:
+            self.invia_messaggio(id_giocatore, {
+                'type': 'error',
+                'message': 'Non puoi fare check, devi chiamare o rilanciare'
+            })
+            return None
+
+        self._log("%s ha fatto check", giocatore.nome)
+        return self._messaggio_azione(id_giocatore, 'check', f"{giocatore.nome} ha fatto check")
+
+    def _azione_call(self, id_giocatore, giocatore, importo):
+        da_chiamare = self.stato_gioco['puntata_corrente'] - giocatore.puntata
+        da_chiamare = min(da_chiamare, giocatore.chips)  # Non più di quello che ho
+
+        giocatore.chips -= da_chiamare
+        giocatore.puntata += da_chiamare
+        self.stato_gioco['piatto'] += da_chiamare
+        self._log("%s ha chiamato %s", giocatore.nome, da_chiamare)
+
+        if giocatore.chips == 0:
+            self._segna_all_in(id_giocatore, giocatore)
+            self._log("%s è all-in!", giocatore.nome)
+
+        return self._messaggio_azione(id_giocatore, 'call', f"{giocatore.nome} ha chiamato {da_chiamare}", da_chiamare)
+
+    def _azione_raise(self, id_giocatore, giocatore, importo):
+        rilancio_minimo = self.stato_gioco['puntata_corrente'] * 2 - giocatore.puntata
+
+        if importo < rilancio_minimo and importo < giocatore.chips:
+            self.invia_messaggio(id_giocatore, {
+                'type': 'error',
+                'message': f'Il rilancio minimo è {rilancio_minimo}'
+            })
+            return None
+
+        importo = min(importo, giocatore.chips)
+        giocatore.chips -= importo
+        self.stato_gioco['piatto'] += importo
+        giocatore.puntata += importo
+        self.stato_gioco['puntata_corrente'] = giocatore.puntata
+
+        e_all_in = giocatore.chips == 0
+        if e_all_in:
+            self._segna_all_in(id_giocatore, giocatore)
+            self._log("%s è all-in con %s!", giocatore.nome, importo)
+        else:
+            self._log("%s ha rilanciato a %s", giocatore.nome, giocatore.puntata)
+
+        testo_azione = 'all-in' if e_all_in else 'raise'
+        messaggio = f"{giocatore.nome} è ALL-IN con {importo}!" if e_all_in else f"{giocatore.nome} ha rilanciato a {giocatore.puntata}"
+
+        return self._messaggio_azione(id_giocatore, testo_azione, messaggio, importo)
+
+    def _log(self, testo="", *argomenti):
+        """
+        Accoda una riga al log della mano corrente (solo in debug). Come
+        per logging, gli argomenti vengono inseriti con % solo se la riga
+        viene davvero scritta.
+        """
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+        self._log_buf.write(testo % argomenti if argomenti else testo)
+        self._log_buf.write("\n")
+
+    def _svuota_log(self):
+        """Passa al logger, come un solo record, il log accumulato."""
+        testo = self._log_buf.getvalue()
+        if testo:
+            logger.debug("%s", testo[:-1])
+            self._log_buf.seek(0)
+            self._log_buf.truncate()
+
+    def _pareggiato(self, giocatore):
+        return (giocatore.puntata == self.stato_gioco['puntata_corrente']
+                or giocatore.foldato or giocatore.all_in)
+
+    def _conta_pareggiati(self):
+        return sum(1 for g in self.giocatori if self._pareggiato(g))
+
+    def _segna_fold(self, id_giocatore, giocatore):
+        giocatore.foldato = True
+        giocatore.all_in = False
+        self._maschera_foldati |= 1 << id_giocatore
+        self._maschera_all_in &= ~(1 << id_giocatore)
+        self._stato_modificato = True
+
+    def _segna_all_in(self, id_giocatore, giocatore):
+        giocatore.all_in = True
+        self._maschera_all_in |= 1 << id_giocatore
+
+    def _unico_non_foldato(self):
+        """Id dell'unico giocatore non foldato, None se ne restano di più."""
+        non_foldati = self._tutti & ~self._maschera_foldati
+        if non_foldati & (non_foldati - 1):
+            return None
+        return non_foldati.bit_length() - 1
+
     def gestisci_fold_forzato(self, id_giocatore, motivo): 
-        giocatore = self.stato_gioco['giocatori'][id_giocatore]
-        if giocatore['foldato']:
+        giocatore = self.giocatori[id_giocatore]
+        if giocatore.foldato:
             return False 
 
-        giocatore['foldato'] = True
-        giocatore['all_in'] = False
+        self._segna_fold(id_giocatore, giocatore)
 
         testo_motivo = {
-            'timeout': f"{giocatore['nome']} ha esaurito il tempo e viene forzato al fold"
-        }.get(motivo, f"{giocatore['nome']} è stato forzato al fold")
-
-        self.broadcast({
-            'type': 'player_action',
-            'player_id': id_giocatore,
-            'player_name': giocatore['nome'],
-            'action': 'forced_fold',
-            'message': testo_motivo
-        })
-        time.sleep(0.3)
-        self.broadcast_stato_gioco()
+            'timeout': f"{giocatore.nome} ha esaurito il tempo e viene forzato al fold"
+        }.get(motivo, f"{giocatore.nome} è stato forzato al fold")
+
+        self._broadcast_azione_con_stato(self._messaggio_azione(id_giocatore, 'forced_fold', testo_motivo))
 
         # Controllo se c'è un vincitore
-        giocatori_attivi = [pid for pid, dati in self.stato_gioco['giocatori'].items() if not dati['foldato']]
-        if len(giocatori_attivi) == 1:
-            self.assegna_piatto(giocatori_attivi[0], motivo)
+        id_vincitore = self._unico_non_foldato()
+        if id_vincitore is not None:
+            self.assegna_piatto(id_vincitore, motivo)
             return True
         return False
 
     def showdown(self):
-        print("\n" + "=" * 60)
-        print("SHOWDOWN")
-        print("=" * 60)
+        self._log("\n" + "=" * 60)
+        self._log("SHOWDOWN")
+        self._log("=" * 60)
 
-        for id_giocatore, giocatore in self.stato_gioco['giocatori'].items():
-            if not giocatore['foldato']:
-                print(f"\n{giocatore['nome']}: {giocatore['carte']}")
+        for id_giocatore, giocatore in enumerate(self.giocatori):
+            if not giocatore.foldato:
+                self._log("\n%s: %s", giocatore.nome, giocatore.carte)
 
         mani = {}
-        for id_giocatore, giocatore in self.stato_gioco['giocatori'].items():
-            if not giocatore['foldato']:
-                tutte_carte = giocatore['carte'] + self.stato_gioco['carte_comuni']
-                mani[id_giocatore] = evaluate_hand(tutte_carte)
-                descrizione = hand_description(tutte_carte)
-                print(f"{giocatore['nome']}: {descrizione}")
+        for id_giocatore, giocatore in enumerate(self.giocatori):
+            if not giocatore.foldato:
+                bits = giocatore.bits_carte | self.stato_gioco['carte_comuni_bits']
+                mani[id_giocatore] = evaluate_hand_bits(bits)
+                if logger.isEnabledFor(logging.DEBUG):
+                    # La descrizione serve solo al log della mano
+                    descrizione = describe_evaluation(mani[id_giocatore])
+                    self._log("%s: %s", giocatore.nome, descrizione)
 
         if len(mani) == 1:
-            id_vincitore = list(mani.keys())[0]
+            id_vincitore = next(iter(mani))
         else:
+            # Le valutazioni (categoria, valori) si confrontano direttamente
             ids_giocatori = list(mani.keys())
-            carte_0 = self.stato_gioco['giocatori'][ids_giocatori[0]]['carte'] + self.stato_gioco['carte_comuni']
-            carte_1 = self.stato_gioco['giocatori'][ids_giocatori[1]]['carte'] + self.stato_gioco['carte_comuni']
-            risultato = compare_hands(carte_0, carte_1)
+            mano_0 = mani[ids_giocatori[0]]
+            mano_1 = mani[ids_giocatori[1]]
 
-            if risultato > 0:
+            if mano_0 > mano_1:
                 id_vincitore = ids_giocatori[0]
-            elif risultato < 0:
+            elif mano_0 < mano_1:
                 id_vincitore = ids_giocatori[1]
             else:
                 self.dividi_piatto(ids_giocatori)
@@ -525,98 +774,126 @@ class ServerPoker:
         self.assegna_piatto(id_vincitore, "showdown")
 
     def assegna_piatto(self, id_vincitore, motivo):
-        vincitore = self.stato_gioco['giocatori'][id_vincitore]
-        vincitore['chips'] += self.stato_gioco['piatto']
-        vincitore.setdefault('statistiche', {'mani_giocate': 0, 'mani_vinte': 0})
-        vincitore['statistiche']['mani_vinte'] += 1
-
-        print(f"\n{vincitore['nome']} vince {self.stato_gioco['piatto']} chips ({motivo})!")
-
-        dati_risultato = {
-            'type': 'hand_result',
-            'winner_id': id_vincitore,
-            'winner_name': vincitore['nome'],
-            'pot': self.stato_gioco['piatto'],
-            'reason': motivo,
-            'all_cards': {},
-            'stats': {pid: giocatore.get('statistiche', {}) for pid, giocatore in self.stato_gioco['giocatori'].items()}
-        }
+        vincitore = self.giocatori[id_vincitore]
+        vincitore.chips += self.stato_gioco['piatto']
+        vincitore.statistiche['mani_vinte'] += 1
+        self._stato_modificato = True
 
-        for pid, giocatore in self.stato_gioco['giocatori'].items():
-            dati_risultato['all_cards'][pid] = [c.to_dict() for c in giocatore['carte']]
+        self._log("\n%s vince %s chips (%s)!", vincitore.nome, self.stato_gioco['piatto'], motivo)
 
-        self.broadcast(dati_risultato)
+        self.broadcast(self._messaggio_risultato(
+            id_vincitore, vincitore.nome, motivo, range(len(self.giocatori))))
         self.broadcast_stato_gioco()
 
         self.stato_gioco['piatto'] = 0
+        self._stato_modificato = True
+
+        if self.giocatori[1 - id_vincitore].chips <= 0:
+            self._vincitore_partita = id_vincitore
+
+        self._svuota_log()
 
     def dividi_piatto(self, ids_giocatori):
         importo_per_giocatore = self.stato_gioco['piatto'] // len(ids_giocatori)
 
         for id_giocatore in ids_giocatori:
-            giocatore = self.stato_gioco['giocatori'][id_giocatore]
-            giocatore['chips'] += importo_per_giocatore
-            giocatore.setdefault('statistiche', {'mani_giocate': 0, 'mani_vinte': 0})
-            giocatore['statistiche']['mani_vinte'] += 1
+            giocatore = self.giocatori[id_giocatore]
+            giocatore.chips += importo_per_giocatore
+            giocatore.statistiche['mani_vinte'] += 1
+        self._stato_modificato = True
 
-        nomi = [self.stato_gioco['giocatori'][pid]['nome'] for pid in ids_giocatori]
-        print(f"\nPareggio! {' e '.join(nomi)} si dividono il piatto di {self.stato_gioco['piatto']} chips")
+        if logger.isEnabledFor(logging.DEBUG):
+            nomi = ' e '.join(self.giocatori[pid].nome for pid in ids_giocatori)
+            self._log("\nPareggio! %s si dividono il piatto di %s chips", nomi, self.stato_gioco['piatto'])
 
-        self.broadcast({
-            'type': 'hand_result',
-            'winner_id': -1,
-            'winner_name': 'Pareggio',
-            'pot': self.stato_gioco['piatto'],
-            'reason': 'split',
-            'all_cards': {pid: [c.to_dict() for c in self.stato_gioco['giocatori'][pid]['carte']]
-                          for pid in ids_giocatori},
-            'stats': {pid: self.stato_gioco['giocatori'][pid].get('statistiche', {}) 
-                      for pid in self.stato_gioco['giocatori']}
-        })
+        self.broadcast(self._messaggio_risultato(-1, 'Pareggio', 'split', ids_giocatori))
 
         self.stato_gioco['piatto'] = 0
+        self._svuota_log()
+
+    def _messaggio_risultato(self, id_vincitore, nome_vincitore, motivo, ids_carte):
+        """Riempie il modello 'hand_result', con le carte dei giocatori indicati."""
+        modello = self._tmpl_hand_result
+        modello['winner_id'] = id_vincitore
+        modello['winner_name'] = nome_vincitore
+        modello['pot'] = self.stato_gioco['piatto']
+        modello['reason'] = motivo
+        carte = modello['all_cards']
+        carte.clear()
+        for pid in ids_carte:
+            carte[pid] = self.giocatori[pid].carte_dict
+        return modello
 
     def chiedi_continua(self):
-        self.broadcast({'type': 'ask_continue'})
+        """
+        Chiede a tutti se continuare, con un'unica scadenza di 30 secondi:
+        le risposte vengono raccolte nell'ordine in cui arrivano.
+        """
+        for id_giocatore in self._destinatari:
+            self._scarta_arretrati(id_giocatore)
+        self._broadcast_payload(_PAYLOAD_ASK_CONTINUE)
 
-        risposte = []
-        for id_giocatore in range(len(self.clients)):
-            try:
-                dati = self.ricevi_messaggio(id_giocatore, timeout=30)
-            except TimeoutAzioneGiocatore:
-                risposte.append(False) 
-                continue
-            risposte.append(bool(dati.get('continue', False)))
+        for id_giocatore, client in enumerate(self.clients):
+            if not client['connesso']:
+                raise ConnessioneGiocatorePersa(id_giocatore)
 
-        return all(risposte) 
+        self._svuota_invii()
+        scadenza = time.monotonic() + 30
+        in_attesa = set(range(len(self.clients)))
+
+        while True:
+            for id_giocatore in list(in_attesa):
+                if self.clients[id_giocatore]['canale'].has_message():
+                    dati = self.ricevi_messaggio(id_giocatore)
+                    if not isinstance(dati, dict) or 'continue' not in dati:
+                        # Ad esempio un'azione arrivata dopo il timeout e dopo
+                        # la domanda: non è una risposta, né un rifiuto
+                        self._ignora_messaggio(id_giocatore, dati)
+                        continue
+                    if not dati['continue']:
+                        return False
+                    in_attesa.discard(id_giocatore)
+
+            if not in_attesa:
+                return True
+
+            rimanente = scadenza - time.monotonic()
+            if rimanente <= 0:
+                return False  # Chi non ha risposto in tempo non continua
+
+            for chiave, _ in self.selettore.select(rimanente):
+                self._leggi_disponibili(chiave.data)
 
     def gestisci_disconnessione(self, id_giocatore):
         if id_giocatore >= len(self.clients):
             return
 
         client = self.clients[id_giocatore]
-        client['connesso'] = False
+        self._segna_disconnesso(id_giocatore)
+        self._ferma_mittente(client, attesa=0)
         try:
             client['canale'].close()
         except OSError:
             pass
 
-        nome_giocatore = self.stato_gioco['giocatori'].get(id_giocatore, {}).get('nome', client['nome'])
-        print(f"\n{nome_giocatore} si è disconnesso. La partita termina.")
+        nome_giocatore = client['nome']
+        self._svuota_log()
+        logger.info("\n%s si è disconnesso. La partita termina.", nome_giocatore)
 
         altro_id = 1 - id_giocatore if len(self.clients) > 1 else None
-        if altro_id is not None and altro_id in self.stato_gioco['giocatori']:
-            vincitore = self.stato_gioco['giocatori'][altro_id]
+        if altro_id is not None and altro_id < len(self.giocatori):
+            vincitore = self.giocatori[altro_id]
             
             if self.stato_gioco['piatto'] > 0:
-                vincitore['chips'] += self.stato_gioco['piatto']
-                vincitore['statistiche']['mani_vinte'] += 1
+                vincitore.chips += self.stato_gioco['piatto']
+                vincitore.statistiche['mani_vinte'] += 1
                 self.stato_gioco['piatto'] = 0
+                self._stato_modificato = True
 
             messaggio = {
                 'type': 'game_over',
-                'winner': vincitore['nome'],
-                'message': f"{nome_giocatore} si è disconnesso. {vincitore['nome']} vince per forfait."
+                'winner': vincitore.nome,
+                'message': f"{nome_giocatore} si è disconnesso. {vincitore.nome} vince per forfait."
             }
 
             try:
@@ -629,67 +906,346 @@ class ServerPoker:
     # =========================================================================
 
     def broadcast_stato_gioco(self):
-        for id_giocatore, client in enumerate(self.clients):
-            if not client.get('connesso', True):
-                continue
+        """
+        Invia lo stato del tavolo a ogni client.
 
-            dati_stato = {
-                'type': 'game_state',
-                'phase': self.stato_gioco['fase'],
-                'pot': self.stato_gioco['piatto'],
-                'community_cards': [c.to_dict() for c in self.stato_gioco['carte_comuni']],
-                'current_bet': self.stato_gioco['puntata_corrente'],
-                'players': {},
-                'your_id': id_giocatore,
-                'active_player': self.stato_gioco['giocatore_attivo'],
-                'dealer_button': self.stato_gioco['dealer_button']
-            }
+        Il primo stato della mano (e ogni cambio di fase) viene inviato per
+        intero come 'game_state'; negli altri casi si invia un 'state_patch'
+        con i soli campi cambiati rispetto all'ultimo invio.
+        """
+        messaggio = self._messaggio_stato()
+        if messaggio is not None:
+            self._broadcast_stato(messaggio)
+
+    def _broadcast_azione_con_stato(self, messaggio_azione, animate_ms=300):
+        """
+        Invia in un unico messaggio l'azione di un giocatore e lo stato aggiornato.
+        """
+        self._broadcast_stato(self._con_stato({
+            't': 'action_and_state',
+            'x': messaggio_azione,
+            'am': animate_ms
+        }))
+
+    def _con_stato(self, messaggio):
+        """
+        Aggiunge al messaggio lo stato del tavolo, solo se è cambiato
+        dall'ultimo invio: i client ignorano uno 'state' assente.
+        """
+        stato = self._messaggio_stato()
+        if stato is not None:
+            messaggio['st'] = stato
+        return messaggio
+
+    def _broadcast_stato(self, messaggio):
+        """
+        Invia a tutti un messaggio che contiene lo stato del tavolo.
 
-            for pid, giocatore in self.stato_gioco['giocatori'].items():
-                dati_stato['players'][pid] = {
-                    'name': giocatore['nome'],
-                    'chips': giocatore['chips'],
-                    'bet': giocatore['puntata'],
-                    'folded': giocatore['foldato'],
-                    'all_in': giocatore['all_in'],
-                    'stats': giocatore.get('statistiche', {})
-                }
+        Il JSON viene prodotto una sola volta: lo stato è uguale per tutti a
+        parte 'your_id', che al posto del segnaposto viene scritto per
+        ciascun client direttamente nei byte serializzati.
+        """
+        # Uno stato inviato da solo diventa inutile se nella coda del client
+        # arriva dopo di lui uno stato completo, che lo rimpiazza per intero
+        solo_stato = messaggio.get('t') in ('game_state', 'state_patch')
+        stato = messaggio if solo_stato else messaggio.get('st')
+        completo = stato is not None and stato['t'] == 'game_state'
+
+        payload = encode_message(messaggio)
+        if not completo:
+            # Le patch non contengono 'your_id': stessi byte per tutti
+            for id_giocatore in self._destinatari:
+                self.invia_payload(id_giocatore, payload, sostituibile=solo_stato)
+            return
 
-            self.invia_messaggio(id_giocatore, dati_stato)
+        testa, coda = payload.split(_SEGNAPOSTO_ID, 1)
+        for id_giocatore in self._destinatari:
+            self.invia_payload(id_giocatore, testa, self._campi_id[id_giocatore], coda,
+                               sostituisce=True, sostituibile=solo_stato)
+
+    def _messaggio_stato(self):
+        """
+        Costruisce il 'game_state' (con 'your_id' segnaposto) o lo
+        'state_patch' comune a tutti i client (None se non è cambiato
+        nulla) e aggiorna l'ultimo stato inviato.
+
+        Lo stato usa le chiavi brevi di WIRE_KEYS; i client le riportano ai
+        nomi estesi con longify().
+        """
+        if not self._stato_modificato:
+            return None
+        self._stato_modificato = False
+
+        stato = self.stato_gioco
+        tavolo = self._wire_tavolo
+        completo = tavolo['ph'] != stato['fase']
+        tavolo['ph'] = stato['fase']
+
+        # Confronti espliciti campo per campo con gli ultimi valori inviati
+        modifiche = {}
+        if tavolo['p'] != stato['piatto']:
+            tavolo['p'] = modifiche['p'] = stato['piatto']
+        if tavolo['cb'] != stato['puntata_corrente']:
+            tavolo['cb'] = modifiche['cb'] = stato['puntata_corrente']
+        if tavolo['ap'] != stato['giocatore_attivo']:
+            tavolo['ap'] = modifiche['ap'] = stato['giocatore_attivo']
+        if tavolo['db'] != stato['dealer_button']:
+            tavolo['db'] = modifiche['db'] = stato['dealer_button']
+        if self._versione_carte_inviata != stato['versione_carte']:
+            # Lista condivisa con stato_gioco: basta confrontare le versioni
+            self._versione_carte_inviata = stato['versione_carte']
+            modifiche['cc'] = stato['carte_comuni_dict']
+
+        # I giocatori si confrontano con il loro wire, aggiornato sul posto
+        giocatori_cambiati = {}
+        for pid, giocatore in enumerate(self.giocatori):
+            diff = giocatore.aggiorna_wire()
+            if diff:
+                giocatori_cambiati[pid] = diff
+        if giocatori_cambiati:
+            modifiche['pl'] = giocatori_cambiati
+
+        if completo:
+            messaggio = self._stato_completo
+            messaggio['ph'] = tavolo['ph']
+            messaggio['p'] = tavolo['p']
+            messaggio['cc'] = stato['carte_comuni_dict']
+            messaggio['cb'] = tavolo['cb']
+            messaggio['ap'] = tavolo['ap']
+            messaggio['db'] = tavolo['db']
+            return messaggio
+
+        if not modifiche:
+            return None
+        return {'t': 'state_patch', 'ch': modifiche}
 
     def broadcast(self, messaggio, escludi=None):
-        escludi = set(escludi or [])
-        for id_giocatore, client in enumerate(self.clients):
-            if id_giocatore in escludi or not client.get('connesso', True):
-                continue
-            self.invia_messaggio(id_giocatore, messaggio)
+        # Serializzato una sola volta per tutti
+        self._broadcast_payload(encode_message(messaggio), escludi)
+
+    def _broadcast_payload(self, payload, escludi=None):
+        destinatari = self._destinatari
+        if escludi:
+            destinatari = [pid for pid in destinatari if pid not in escludi]
+        for id_giocatore in destinatari:
+            self.invia_payload(id_giocatore, payload)
 
     def invia_messaggio(self, id_giocatore, messaggio):
+        self.invia_payload(id_giocatore, encode_message(messaggio))
+
+    def invia_payload(self, id_giocatore, *parti, sostituisce=False, sostituibile=False):
+        """
+        Accoda per il client uno o più buffer già serializzati, che il suo
+        thread di invio scrive in sequenza senza concatenarli: il gioco non
+        resta mai bloccato sulla send di un client lento.
+
+        'sostituisce' indica un messaggio con lo stato completo del tavolo;
+        un messaggio 'sostituibile' (solo stato) ancora in coda quando ne
+        arriva uno così viene scartato dal thread di invio.
+
+        Durante la partita i messaggi vengono trattenuti fino al prossimo
+        _svuota_invii, che li accoda insieme come un unico blocco.
+        """
+        messaggio = (parti, sostituisce, sostituibile)
+        if self._in_coda is not None:
+            self._in_coda.setdefault(id_giocatore, []).append(messaggio)
+            return
+        self._accoda_invio(id_giocatore, [messaggio])
+
+    def _accoda_invio(self, id_giocatore, messaggi):
         client = self.clients[id_giocatore]
-        if not client.get('connesso', True):
+        if not client['connesso']:
             return
+        if client['errore_invio']:
+            self._segna_disconnesso(id_giocatore)
+            raise ConnessioneGiocatorePersa(id_giocatore)
+        # L'epoca sale a ogni stato completo: vale anche dentro un blocco,
+        # dove uno stato completo supera i messaggi di solo stato che lo precedono
+        blocco = []
+        for parti, sostituisce, sostituibile in messaggi:
+            if sostituisce:
+                client['epoca_stato'] += 1
+            blocco.append((parti, client['epoca_stato'] if sostituibile else None))
         try:
-            client['canale'].send(messaggio)
-        except ConnectionClosed as errore:
-            client['connesso'] = False
+            client['coda_invio'].put_nowait(blocco)
+        except queue.Full as errore:
+            # Il client non sta leggendo: meglio perderlo che bloccare il tavolo
+            self._segna_disconnesso(id_giocatore)
             raise ConnessioneGiocatorePersa(id_giocatore) from errore
 
+    def _avvia_mittente(self, id_giocatore):
+        client = self.clients[id_giocatore]
+        client['thread_invio'] = threading.Thread(
+            target=self._ciclo_invio, args=(client,), daemon=True)
+        client['thread_invio'].start()
+
+    def _ciclo_invio(self, client):
+        """
+        Thread di invio di un client: scrive i messaggi accodati fino a None.
+
+        Tutto ciò che è già in coda quando il thread si sveglia viene scritto
+        con una sola sendmsg, così i messaggi arretrati partono insieme.
+        """
+        coda = client['coda_invio']
+        while True:
+            elementi = [coda.get()]
+            while True:
+                try:
+                    elementi.append(coda.get_nowait())
+                except queue.Empty:
+                    break
+
+            parti = []
+            fine = False
+            for elemento in elementi:
+                if elemento is None:
+                    fine = True
+                    break
+                for parti_messaggio, epoca in elemento:
+                    if epoca is not None and epoca < client['epoca_stato']:
+                        continue  # Superato da uno stato completo già in coda
+                    parti.extend(parti_messaggio)
+
+            if parti:
+                try:
+                    client['canale'].send_parts(parti)
+                except (ConnectionClosed, OSError):
+                    # Segnalato al thread di gioco al prossimo invia_payload
+                    client['errore_invio'] = True
+                    return
+            if fine:
+                return
+
+    def _ferma_mittente(self, client, attesa):
+        """Chiude la coda del client e aspetta fino ad 'attesa' secondi che si svuoti."""
+        self._chiudi_coda(client)
+        client['thread_invio'].join(attesa)
+
+    def _chiudi_coda(self, client):
+        try:
+            client['coda_invio'].put_nowait(None)
+        except queue.Full:
+            pass  # Il thread uscirà quando la chiusura del socket fa fallire la send
+
+    def _svuota_invii(self):
+        """
+        Passa ai thread di invio i messaggi trattenuti, un blocco per client.
+        Va chiamato prima di ogni attesa di una risposta e in chiusura.
+        """
+        in_coda = self._in_coda
+        if not in_coda:
+            return
+        for id_giocatore in list(in_coda):
+            # Tolto prima dell'invio: se un client è perso, gli altri blocchi
+            # restano trattenuti per il prossimo svuotamento
+            self._accoda_invio(id_giocatore, in_coda.pop(id_giocatore))
+
     def ricevi_messaggio(self, id_giocatore, timeout=None):
+        """
+        Attende il prossimo messaggio del giocatore entro il timeout.
+
+        L'attesa passa dal selettore condiviso: i dati che arrivano nel
+        frattempo dall'altro client vengono accumulati nel suo buffer, e una
+        sua disconnessione viene rilevata subito.
+        """
         client = self.clients[id_giocatore]
-        if not client.get('connesso', True):
+        if not client['connesso']:
             raise ConnessioneGiocatorePersa(id_giocatore)
 
+        self._svuota_invii()
+        canale = client['canale']
+        scadenza = None if timeout is None else time.monotonic() + timeout
+
+        while not canale.has_message():
+            rimanente = None
+            if scadenza is not None:
+                rimanente = scadenza - time.monotonic()
+                if rimanente <= 0:
+                    raise TimeoutAzioneGiocatore(id_giocatore)
+
+            for chiave, _ in self.selettore.select(rimanente):
+                self._leggi_disponibili(chiave.data)
+
         try:
-            return client['canale'].receive(timeout=timeout)
-        except TimeoutError as errore:
-            raise TimeoutAzioneGiocatore(id_giocatore) from errore
+            return canale.receive()
         except ConnectionClosed as errore:
-            client['connesso'] = False
+            self._segna_disconnesso(id_giocatore)
             raise ConnessioneGiocatorePersa(id_giocatore) from errore
 
+    def _scarta_arretrati(self, id_giocatore):
+        """
+        Scarta i messaggi già ricevuti dal giocatore prima di una nuova
+        richiesta. Quelli che arrivano dopo la richiesta vengono filtrati
+        per tipo da _ricevi_azione e chiedi_continua.
+        """
+        canale = self.clients[id_giocatore]['canale']
+        while canale.has_message():
+            # Già nel buffer: nessuna lettura dal socket
+            self._ignora_messaggio(id_giocatore, canale.receive())
+
+    def _ignora_messaggio(self, id_giocatore, dati):
+        logger.debug("Messaggio in ritardo da %s ignorato: %s",
+                     self.clients[id_giocatore]['nome'], dati)
+
+    def _ricevi_azione(self, id_giocatore):
+        """
+        Attende un messaggio d'azione del giocatore entro timeout_azione.
+
+        Gli altri messaggi (ad esempio una risposta tardiva ad 'ask_continue')
+        vengono ignorati senza far ripartire il tempo a disposizione.
+        """
+        scadenza = time.monotonic() + self.timeout_azione
+        while True:
+            rimanente = max(0, scadenza - time.monotonic())
+            dati = self.ricevi_messaggio(id_giocatore, timeout=rimanente)
+            # I client meno recenti non indicano il tipo: basta 'action'
+            if (isinstance(dati, dict) and dati.get('type', 'action') == 'action'
+                    and 'action' in dati):
+                return dati
+            self._ignora_messaggio(id_giocatore, dati)
+
+    def _leggi_disponibili(self, id_giocatore):
+        try:
+            self.clients[id_giocatore]['canale'].read_available()
+        except (ConnectionClosed, OSError) as errore:
+            self._segna_disconnesso(id_giocatore)
+            raise ConnessioneGiocatorePersa(id_giocatore) from errore
+
+    def _segna_disconnesso(self, id_giocatore):
+        client = self.clients[id_giocatore]
+        client['connesso'] = False
+        self._rimuovi_dal_selettore(client['canale'])
+        self._aggiorna_destinatari()
+
+    def _aggiorna_destinatari(self):
+        """Ricalcola i client connessi, letti dai broadcast a ogni invio."""
+        self._destinatari = [pid for pid, client in enumerate(self.clients)
+                             if client['connesso']]
+
+    def _rimuovi_dal_selettore(self, canale):
+        try:
+            self.selettore.unregister(canale)
+        except (KeyError, ValueError):
+            pass
+
     def chiudi(self):
-        print("\nChiusura del server...")
+        while self._in_coda:
+            try:
+                self._svuota_invii()
+            except ConnessioneGiocatorePersa:
+                pass  # Client perso: si passa ai blocchi degli altri
+        self._in_coda = None
+        self._svuota_log()
+        logger.info("\nChiusura del server...")
         
+        # Tutti i mittenti svuotano le code in parallelo, con un'unica
+        # scadenza di 5 secondi invece di 5 secondi per client
+        for client in self.clients:
+            self._chiudi_coda(client)
+        scadenza = time.monotonic() + 5
+        for client in self.clients:
+            client['thread_invio'].join(max(0, scadenza - time.monotonic()))
+
         for client in self.clients:
             try:
                 client['canale'].close()
@@ -699,12 +1255,36 @@ class ServerPoker:
         if self.socket_server:
             self.socket_server.close()
 
+        self.selettore.close()
+
+
+def avvia_log():
+    """
+    Collega il logger del server a stdout tramite un thread dedicato: il
+    thread di gioco accoda soltanto i record. Restituisce il listener, da
+    fermare in uscita per scrivere quelli rimasti.
+
+    Il racconto delle mani è a livello DEBUG e viene scritto solo se la
+    variabile d'ambiente POKER_DEBUG è impostata.
+    """
+    coda_log = queue.Queue(-1)
+    uscita = logging.StreamHandler(sys.stdout)
+    uscita.setFormatter(logging.Formatter("%(message)s"))
+    listener = logging.handlers.QueueListener(coda_log, uscita)
+
+    logger.addHandler(logging.handlers.QueueHandler(coda_log))
+    logger.setLevel(logging.DEBUG if os.environ.get('POKER_DEBUG') else logging.INFO)
+    logger.propagate = False
+    listener.start()
+    return listener
+
 
 # =============================================================================
 # PUNTO DI INGRESSO DEL PROGRAMMA
 # =============================================================================
 
 if __name__ == "__main__":
+    listener_log = avvia_log()
     host = os.environ.get('POKER_HOST') or (sys.argv[1] if len(sys.argv) > 1 else '0.0.0.0')
     try:
         porta = int(os.environ.get('POKER_PORT') or (sys.argv[2] if len(sys.argv) > 2 else 5555))
@@ -715,10 +1295,10 @@ if __name__ == "__main__":
     try:
         server.avvia()
     except KeyboardInterrupt:
-        print("\n\nServer interrotto dall'utente")
+        logger.info("\n\nServer interrotto dall'utente")
         server.chiudi()
     except Exception as errore:
-        print(f"\nErrore fatale: {errore}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("\nErrore fatale: %s", errore)
         server.chiudi()
+    finally:
+        listener_log.stop()
@@ -0,0 +1,118 @@
+import os
+import random
+import sys
+import unittest
+from collections import Counter
+from itertools import combinations
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from poker_game import Card, HandRank, _evaluate_mask, evaluate_hand, evaluate_hand_bits
+
+
+MAZZO = [Card(valore, seme) for seme in Card.SUITS for valore in Card.VALUES]
+
+
+def _valuta_cinque(carte):
+    """Valutazione di riferimento di esattamente 5 carte, senza tabelle."""
+    valori = sorted((c.rank for c in carte), reverse=True)
+    colore = len({c.suit for c in carte}) == 1
+
+    scala = 0
+    if len(set(valori)) == 5:
+        if valori[0] - valori[4] == 4:
+            scala = valori[0]
+        elif valori == [14, 5, 4, 3, 2]:
+            scala = 5
+
+    # Valori ordinati per molteplicità, poi per valore
+    gruppi = sorted(Counter(valori).items(), key=lambda g: (g[1], g[0]), reverse=True)
+    conteggi = [n for _, n in gruppi]
+    ordinati = tuple(v for v, _ in gruppi)
+
+    if scala and colore:
+        if scala == 14:
+            return (HandRank.ROYAL_FLUSH, (14,))
+        return (HandRank.STRAIGHT_FLUSH, (scala,))
+    if conteggi == [4, 1]:
+        return (HandRank.FOUR_OF_A_KIND, ordinati)
+    if conteggi == [3, 2]:
+        return (HandRank.FULL_HOUSE, ordinati)
+    if colore:
+        return (HandRank.FLUSH, tuple(valori))
+    if scala:
+        return (HandRank.STRAIGHT, (scala,))
+    if conteggi == [3, 1, 1]:
+        return (HandRank.THREE_OF_A_KIND, ordinati)
+    if conteggi == [2, 2, 1]:
+        return (HandRank.TWO_PAIR, ordinati)
+    if conteggi == [2, 1, 1, 1]:
+        return (HandRank.PAIR, ordinati)
+    return (HandRank.HIGH_CARD, tuple(valori))
+
+
+def _migliore_di_cinque(carte):
+    return max(_valuta_cinque(combinazione) for combinazione in combinations(carte, 5))
+
+
+def _carte(testo):
+    """'A♠ 10♥ ...' -> lista di Card."""
+    return [Card(carta[:-1], carta[-1]) for carta in testo.split()]
+
+
+def _maschera(carte):
+    mask = 0
+    for c in carte:
+        mask |= c.bit
+    return mask
+
+
+class TestValutazioneMani(unittest.TestCase):
+
+    def assertComeForzaBruta(self, carte):
+        self.assertEqual(_evaluate_mask(_maschera(carte)), _migliore_di_cinque(carte),
+                         msg=" ".join(map(str, carte)))
+
+    def test_mani_casuali(self):
+        generatore = random.Random(1234)
+        for numero in (5, 6, 7):
+            for _ in range(3000):
+                self.assertComeForzaBruta(generatore.sample(MAZZO, numero))
+
+    def test_scala_minima(self):
+        carte = _carte("A♠ 2♥ 3♦ 4♣ 5♠ 9♥ K♦")
+        self.assertEqual(evaluate_hand(carte), (HandRank.STRAIGHT, (5,)))
+        self.assertComeForzaBruta(carte)
+
+    def test_scala_colore_minima(self):
+        carte = _carte("A♥ 2♥ 3♥ 4♥ 5♥ 6♠ K♥")
+        self.assertEqual(evaluate_hand(carte), (HandRank.STRAIGHT_FLUSH, (5,)))
+        self.assertComeForzaBruta(carte)
+
+    def test_scala_reale(self):
+        carte = _carte("10♣ J♣ Q♣ K♣ A♣ 9♣ 2♦")
+        self.assertEqual(evaluate_hand(carte), (HandRank.ROYAL_FLUSH, (14,)))
+        self.assertComeForzaBruta(carte)
+
+    def test_tre_coppie(self):
+        # Il kicker può venire dalla terza coppia
+        carte = _carte("K♠ K♥ 9♦ 9♣ 7♠ 7♥ 2♦")
+        self.assertEqual(evaluate_hand(carte), (HandRank.TWO_PAIR, (13, 9, 7)))
+        self.assertComeForzaBruta(carte)
+
+    def test_due_tris(self):
+        carte = _carte("8♠ 8♥ 8♦ 4♣ 4♠ 4♥ A♦")
+        self.assertEqual(evaluate_hand(carte), (HandRank.FULL_HOUSE, (8, 4)))
+        self.assertComeForzaBruta(carte)
+
+    def test_numero_di_carte_non_valido(self):
+        otto = _carte("A♠ A♥ A♦ A♣ K♠ Q♠ J♠ 9♠")
+        for carte in (otto, otto[:4]):
+            with self.assertRaises(ValueError):
+                evaluate_hand(carte)
+            with self.assertRaises(ValueError):
+                evaluate_hand_bits(_maschera(carte))
+
+
+if __name__ == '__main__':
+    unittest.main()